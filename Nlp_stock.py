@@ -1,8 +1,126 @@
 import sqlite3
+import atexit
+import os
+import pathlib
+import hashlib
+import threading
 from google import genai
 from google.genai import types
 import time
 import re
+import sys
+from collections import deque
+
+# Keywords for each screener intent, keys are the intent labels used by create_sql_query.
+# Listed in priority order: when a message hits several intents the earlier one wins
+INTENT_KEYWORDS = {
+    "value": frozenset({'value', 'cheap', 'undervalued'}),
+    "growth": frozenset({'growth', 'growing', 'high growth'}),
+    "dividend": frozenset({'dividend', 'income', 'yield'}),
+    "safe": frozenset({'safe', 'stable', 'low risk'}),
+    "large": frozenset({'large cap', 'big', 'large'}),
+}
+
+# Words that mean the user wants us to look up stocks in the database
+NEEDS_DATA_KEYWORDS = frozenset({
+    'find', 'show', 'recommend', 'suggest', 'good', 'best', 'stocks',
+    'companies', 'investment', 'buy', 'portfolio'
+})
+
+def keyword_pattern(keywords) -> str:
+    """Regex alternation of the keywords, longest first so phrases like 'large cap' win"""
+    return "|".join(re.escape(k) for k in sorted(keywords, key=lambda k: (-len(k), k)))
+
+# Keyword patterns compiled once at import, each message is scanned a single time.
+# Keywords match at the start of a word, named groups are the intent labels
+INTENT_RE = re.compile(
+    r"\b(?:" + "|".join(
+        f"(?P<{intent}>{keyword_pattern(keywords)})" for intent, keywords in INTENT_KEYWORDS.items()
+    ) + ")"
+)
+NEEDS_DATA_RE = re.compile(r"\b(?:" + keyword_pattern(NEEDS_DATA_KEYWORDS) + ")")
+
+# How long a cached Gemini answer stays valid, in seconds (matches Gemini's 1 hour cache lifetime)
+RESPONSE_CACHE_TTL = 3600
+# Cache file lives next to this module, not in whatever directory the app was started from
+RESPONSE_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".gemini_cache.db")
+
+# Lifetime of the server-side Gemini cache holding the system prompt, in seconds
+PROMPT_CACHE_TTL = 3600
+# Gemini refuses to cache content below this many tokens (gemini-2.5-flash minimum)
+MIN_CACHE_TOKENS = 1024
+# Rough chars-per-token ratio, good enough to decide locally whether caching can work
+CHARS_PER_TOKEN = 4
+
+class ResponseCache:
+    """
+    SQLite table of AI answers keyed by prompt hash. One instance is shared by every
+    screener in the process (Streamlit builds one per session), a lock serializes access
+    """
+    def __init__(self, path, ttl):
+        self.path = path
+        self.ttl = ttl
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        # Opened on first use so importing the module doesn't touch the disk
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, created REAL, text TEXT)"
+            )
+            atexit.register(self._conn.close)
+        return self._conn
+
+    def get(self, key: str):
+        """Returns: the cached answer, or None when missing or older than the TTL"""
+        try:
+            with self._lock:
+                row = self._connect().execute(
+                    "SELECT text FROM responses WHERE key = ? AND created > ?",
+                    (key, time.time() - self.ttl)
+                ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Response cache error: {e}")
+            return None
+        return row[0] if row else None
+
+    def set(self, key: str, text: str):
+        """Store an answer and drop the expired ones so the file doesn't grow forever"""
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connect()
+                with conn:
+                    conn.execute("DELETE FROM responses WHERE created <= ?", (now - self.ttl,))
+                    conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?)", (key, now, text))
+        except sqlite3.Error as e:
+            print(f"Response cache error: {e}")
+
+RESPONSE_CACHE = ResponseCache(RESPONSE_CACHE_PATH, RESPONSE_CACHE_TTL)
+
+# Static prompt text. The system prompt goes to Gemini as a (cached) system
+# instruction, the templates are formatted per call by create_ai_prompt
+SYSTEM_PROMPT = """
+You are a friendly stock market expert. You help users find good stocks to invest in.
+
+Your database contains Indian stocks with these details:
+- symbol, name, sector, industry
+- market_cap, pe_ratio, pb_ratio, roe
+- debt_to_equity, current_ratio, revenue_growth
+- net_profit_margin, dividend_yield, price, volume
+
+Be conversational, friendly, and give specific stock recommendations with reasons.
+"""
+HISTORY_TEMPLATE = "User: {user}\nYou: {assistant}\n\n"
+# Stocks go in as compact CSV rows, far fewer input tokens than labelled lines
+STOCK_CSV_HEADER = "symbol,pe_ratio,roe_pct,market_cap_crores\n"
+STOCK_TEMPLATE = "{symbol},{pe_ratio},{roe},{market_cap}\n"
+QUESTION_TEMPLATE = (
+    "User's current question: {user_message}\n\n"
+    "Please respond conversationally and recommend specific stocks with reasons."
+)
 
 class NLPStockScreener:
     """
@@ -25,193 +143,275 @@ class NLPStockScreener:
         self.client = genai.Client(api_key=api_key)
         self.model_name = "gemini-2.5-flash"
         
-        # Database connection
+        # Database connection - opened read-only on first use and reused for every query
         self.db_path = db_path
+        self._conn = None
+        
+        # Screener queries keyed by intent. The SQL text never changes so SQLite
+        # keeps each one compiled in its statement cache, thresholds are bound per call
+        self._stmts = {
+            # Value stocks: low PE, low PB, good ROE
+            "value": "SELECT * FROM stocks WHERE pe_ratio < ? AND pb_ratio < ? AND roe > ? ORDER BY pe_ratio ASC LIMIT ?",
+            # Growth stocks: high revenue growth, good ROE
+            "growth": "SELECT * FROM stocks WHERE revenue_growth > ? AND roe > ? ORDER BY revenue_growth DESC LIMIT ?",
+            # Dividend stocks: high dividend yield
+            "dividend": "SELECT * FROM stocks WHERE dividend_yield > ? ORDER BY dividend_yield DESC LIMIT ?",
+            # Safe stocks: low debt, good liquidity, decent ROE
+            "safe": "SELECT * FROM stocks WHERE debt_to_equity < ? AND current_ratio > ? AND roe > ? ORDER BY debt_to_equity ASC LIMIT ?",
+            # Large cap stocks: high market cap
+            "large": "SELECT * FROM stocks WHERE market_cap > ? ORDER BY market_cap DESC LIMIT ?",
+            # Default: good quality stocks
+            "quality": "SELECT * FROM stocks WHERE roe > ? AND pe_ratio < ? AND debt_to_equity < ? ORDER BY roe DESC LIMIT ?",
+        }
+        self._params = {
+            "value": (15, 2, 10, 15),
+            "growth": (15, 20, 15),
+            "dividend": (2, 15),
+            "safe": (0.5, 1.5, 10, 15),
+            "large": (50000, 15),
+            "quality": (15, 30, 1, 15),
+        }
+        
+        # Results per intent for this session, dropped whenever the database file changes
+        self._sql_cache = {}
+        self._db_mtime = self.database_mtime()
+        
+        # On-disk cache of AI answers keyed by prompt hash, so repeat questions skip the API call
+        self._resp_cache = RESPONSE_CACHE
+        
+        # Seconds between words in stream_typing, 0 prints each chunk at once
+        self.typing_delay = 0.0
         
         # Memory for conversation
-        self.conversation_history = []  # Stores previous messages
+        self.conversation_history = deque(maxlen=4)  # Stores the last 4 messages, older ones drop off
         self.current_stocks = []       # Currently loaded stock data
         
         # Instructions for the AI on how to behave
-        self.system_prompt = """
-You are a friendly stock market expert. You help users find good stocks to invest in.
-
-Your database contains Indian stocks with these details:
-- symbol, name, sector, industry
-- market_cap, pe_ratio, pb_ratio, roe
-- debt_to_equity, current_ratio, revenue_growth
-- net_profit_margin, dividend_yield, price, volume
-
-Be conversational, friendly, and give specific stock recommendations with reasons.
-"""
+        self.system_prompt = SYSTEM_PROMPT
+        
+        # Server-side Gemini cache holding the system prompt, created on first use
+        self._cache_name = None
+        self._cache_created = 0.0
 
     def connect_to_database(self):
         """
-        Create a connection to the SQLite database
+        Get the shared read-only connection to the SQLite database, opening it on first use
+        so a missing database shows up as a search error instead of failing at startup
         Returns: sqlite3.Connection object
         """
-        return sqlite3.connect(self.db_path)
+        if self._conn is None:
+            # Proper file: URI, so '#', '?' or '%' in the path aren't read as URI syntax
+            uri = pathlib.Path(self.db_path).resolve().as_uri() + "?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            # journal_mode can't be changed on a read-only connection, WAL is set by the scraper
+            conn.executescript("""
+                PRAGMA synchronous=NORMAL;
+                PRAGMA mmap_size=268435456;
+                PRAGMA cache_size=-65536;
+                PRAGMA temp_store=MEMORY;
+            """)
+            conn.row_factory = sqlite3.Row  # rows come back name-indexable straight from C
+            atexit.register(conn.close)
+            self._conn = conn
+        return self._conn
+
+    def database_mtime(self) -> float:
+        """
+        Last modification time of the database
+        Returns: newest mtime of the db file and its WAL file (writes land in the WAL first),
+        0.0 when the database doesn't exist yet
+        """
+        paths = [self.db_path, f"{self.db_path}-wal"]
+        return max((os.stat(path).st_mtime for path in paths if os.path.exists(path)), default=0.0)
 
     def search_stocks(self, user_query: str):
         try:
+            # Decide what SQL query to run based on user's words, create_sql_query returns the intent label
+            intent = self.create_sql_query(user_query)
+            
+            # Reuse this session's results for the intent unless the scraper has updated the database
+            db_mtime = self.database_mtime()
+            if db_mtime != self._db_mtime:
+                self._sql_cache.clear()
+                self._db_mtime = db_mtime
+            if intent in self._sql_cache:
+                return self._sql_cache[intent]
+            
             # Connect to database
             conn = self.connect_to_database()
             cursor = conn.cursor()
             
-            # Decide what SQL query to run based on user's words the create_sql_query will writen the qeury and  than save it to sql_query
-            sql_query = self.create_sql_query(user_query)
-            
-            # Execute the query using cursor.execute 
-            cursor.execute(sql_query) 
+            # Execute the prepared query with its bound thresholds using cursor.execute 
+            cursor.execute(self._stmts[intent], self._params[intent]) 
             
-            # Get column names of the companies 0th index one by one save in column as list . # it will return all columns names
-            columns = [description[0] for description in cursor.description]
-            
-            # Convert results to list of dictionaries  , 
-            results = []
-            for row in cursor.fetchall(): # cursor.fetchall() retrieves all rows from the result set.Each row is a tuple of values (e.g., ("ITC", 195.12)).
-                stock_dict = dict(zip(columns, row)) # save one by one with key value and the row value zip(columns, row) pairs each column name with the corresponding value from the row.
-                results.append(stock_dict) # append the result vy this dict 
-            
-            conn.close()
-            return results 
+            # Convert results to list of dictionaries, each sqlite3.Row already maps column name -> value
+            # so dict(row) builds it in C (callers use stock.get(...), which Row doesn't have)
+            results = [dict(row) for row in cursor.fetchall()]
+            self._sql_cache[intent] = results
+            return results
             
         except Exception as e:
             print(f"Database error: {e}")
             return []
 
     def create_sql_query(self, user_query: str) -> str:
+        """
+        Pick which prepared screener query fits the user's words
+        Returns: intent label, a key into self._stmts / self._params
+        """
         query = user_query.lower() # query the is saved in lower case 
         
-        # Look for keywords and return appropriate SQL
-        if any(word in query for word in ['value', 'cheap', 'undervalued']):
-            # Value stocks: low PE, low PB, good ROE
-            return """
-            SELECT * FROM stocks 
-            WHERE pe_ratio < 15 AND pb_ratio < 2 AND roe > 10 
-            ORDER BY pe_ratio ASC 
-            LIMIT 15
-            """
-        
-        elif any(word in query for word in ['growth', 'growing', 'high growth']):
-            # Growth stocks: high revenue growth, good ROE
-            return """
-            SELECT * FROM stocks 
-            WHERE revenue_growth > 15 AND roe > 20 
-            ORDER BY revenue_growth DESC 
-            LIMIT 15
-            """
-        
-        elif any(word in query for word in ['dividend', 'income', 'yield']):
-            # Dividend stocks: high dividend yield
-            return """
-            SELECT * FROM stocks 
-            WHERE dividend_yield > 2 
-            ORDER BY dividend_yield DESC 
-            LIMIT 15
-            """
-        
-        elif any(word in query for word in ['safe', 'stable', 'low risk']):
-            # Safe stocks: low debt, good liquidity, decent ROE
-            return """
-            SELECT * FROM stocks 
-            WHERE debt_to_equity < 0.5 AND current_ratio > 1.5 AND roe > 10 
-            ORDER BY debt_to_equity ASC 
-            LIMIT 15
-            """
+        # One scan over the query collects every intent keyword it mentions
+        intents = {match.lastgroup for match in INTENT_RE.finditer(query)}
         
-        elif any(word in query for word in ['large cap', 'big', 'large']):
-            # Large cap stocks: high market cap
-            return """
-            SELECT * FROM stocks 
-            WHERE market_cap > 50000 
-            ORDER BY market_cap DESC 
-            LIMIT 15
-            """
-        
-        else:
-            # Default: good quality stocks
-            return """
-            SELECT * FROM stocks 
-            WHERE roe > 15 AND pe_ratio < 30 AND debt_to_equity < 1 
-            ORDER BY roe DESC 
-            LIMIT 15
-            """
+        # Return the highest priority intent, default is good quality stocks
+        for intent in INTENT_KEYWORDS:
+            if intent in intents:
+                return intent
+        return "quality"
 
     def create_ai_prompt(self, user_message: str, stock_data: list = None) -> str:
-        prompt = f"{self.system_prompt}\n\n" # system prompt saving in prompt 
+        # Collect the prompt pieces in a list and join once at the end
+        # The system prompt is not part of it, it is sent as the system instruction
+        parts = []
         
         # Add previous conversation for context 
         if self.conversation_history:
-            prompt += "Previous conversation:\n"
-            # Only include last 4 messages to keep prompt manageable
-            for msg in self.conversation_history[-4:]: # the last -4 in will be saved 
-                prompt += f"User: {msg['user']}\n" # adding the user message
-                prompt += f"You: {msg['assistant']}\n\n" # assistent message from history 
+            parts.append("Previous conversation:\n")
+            # History only keeps the last 4 messages, which keeps the prompt manageable
+            parts.extend(HISTORY_TEMPLATE.format(**msg) for msg in self.conversation_history)
         
         # Add current stock data if we have it
         if stock_data:
-            prompt += "Here are the stocks I found in the database:\n"
-            for i, stock in enumerate(stock_data[:8], 1):  # Show max 8 stocks
-                prompt += f"{i}. {stock.get('name', 'N/A')} ({stock.get('symbol', 'N/A')})\n"
-                prompt += f"   Sector: {stock.get('sector', 'N/A')}\n"
-                prompt += f"   PE Ratio: {stock.get('pe_ratio', 'N/A')}\n"
-                prompt += f"   ROE: {stock.get('roe', 'N/A')}%\n"
-                prompt += f"   Market Cap: ₹{stock.get('market_cap', 'N/A')} crores\n\n"
+            parts.append("Here are the stocks I found in the database:\n")
+            parts.append(STOCK_CSV_HEADER)
+            parts.extend(
+                STOCK_TEMPLATE.format(
+                    symbol=stock.get('symbol', 'N/A'),
+                    pe_ratio=self.format_number(stock.get('pe_ratio')),
+                    roe=self.format_number(stock.get('roe')),
+                    market_cap=self.format_number(stock.get('market_cap')),
+                )
+                for stock in stock_data[:8]  # Show max 8 stocks
+            )
+            parts.append("\n")
         
         # Add the current user question 
-        prompt += f"User's current question: {user_message}\n\n"
-        prompt += "Please respond conversationally and recommend specific stocks with reasons."
+        parts.append(QUESTION_TEMPLATE.format(user_message=user_message))
         
-        return prompt
+        return "".join(parts)
 
-    def get_ai_response(self, prompt: str) -> str:
+    def format_number(self, value) -> str:
+        """Short text for a number in the stock rows, N/A when missing"""
+        if value is None:
+            return "N/A"
+        if isinstance(value, float):
+            return f"{value:.2f}"
+        return str(value)
+
+    def get_prompt_cache(self):
+        """
+        Get the Gemini cached content holding the system prompt, so it isn't re-sent and re-tokenized per call
+        Returns: cache name, or None if caching isn't available (e.g. prompt below Gemini's minimum cache size)
+        """
+        # Too short for Gemini to cache - don't pay an API round trip that is bound to fail
+        if len(self.system_prompt) // CHARS_PER_TOKEN < MIN_CACHE_TOKENS:
+            return None
+        
+        if time.time() - self._cache_created < PROMPT_CACHE_TTL:
+            return self._cache_name
+        
+        # (Re)create once per TTL, also when the last attempt failed so we don't retry every message
+        self._cache_created = time.time()
+        try:
+            cache = self.client.caches.create(
+                model=self.model_name,
+                config=types.CreateCachedContentConfig(
+                    system_instruction=self.system_prompt,
+                    ttl=f"{PROMPT_CACHE_TTL}s"
+                )
+            )
+            self._cache_name = cache.name
+        except Exception as e:
+            print(f"Prompt cache unavailable, sending system prompt with each request: {e}")
+            self._cache_name = None
+        
+        return self._cache_name
+
+    def stream_ai_response(self, prompt: str):
+        """
+        Stream the AI answer for a prompt
+        Yields: text chunks as Gemini decodes them
+        """
+        # The prompt holds the recent conversation, stocks found and the question. The system
+        # prompt is sent separately, so hash it too - editing it must not serve old answers
+        key = hashlib.sha256((self.system_prompt + prompt).encode()).hexdigest()
+        cached = self._resp_cache.get(key)
+        if cached:
+            yield cached
+            return
        
         try:
-            # Call Gemini API with the prompt .
-            response = self.client.models.generate_content(
+            # System prompt comes from the server-side cache when we have one
+            cache_name = self.get_prompt_cache()
+            
+            # Call Gemini API with the prompt, chunks arrive while the model is still generating
+            stream = self.client.models.generate_content_stream(
                 model=self.model_name,
                 contents=prompt,
                 config=types.GenerateContentConfig(
                     temperature=0.7,  # Controls randomness (0-1)
-                    thinking_config=types.ThinkingConfig(thinking_budget=0)
+                    thinking_config=types.ThinkingConfig(thinking_budget=0),  # no thinking tokens
+                    cached_content=cache_name,
+                    system_instruction=None if cache_name else self.system_prompt
                 )
             )
-            # it will return text  response
-            return response.text
+            chunks = []
+            for chunk in stream:
+                if chunk.text:
+                    chunks.append(chunk.text)
+                    yield chunk.text
+            
+            # cache successful answers once the stream is complete
+            text = "".join(chunks)
+            if text:
+                self._resp_cache.set(key, text)
             
         except Exception as e:
-            return f"Sorry, I encountered an error: {e}"
-
-    def simulate_typing(self, text: str):
-
-
-        sentences = re.split(r'(?<=[.!?])\s+', text) 
-        
-        
-        for sentence in sentences:
-            words = sentence.split()
-            for word in words:
-                print(word, end=" ", flush=True)
-                time.sleep(0.00)  # Adjust typing speed here
-
-
+            yield f"Sorry, I encountered an error: {e}"
 
+    def get_ai_response(self, prompt: str) -> str:
+        # Collect the whole streamed answer into one string
+        return "".join(self.stream_ai_response(prompt))
 
-            # Pause at end of sentences
-            if sentence.strip().endswith(('.', '!', '?')):
-                time.sleep(0.00)
+    def stream_typing(self, chunks) -> str:
+        """Print text chunks as they arrive and return the full text"""
+        text = []
+        for chunk in chunks:
+            text.append(chunk)
+            
+            # No typing effect by default, write each chunk in one go
+            if self.typing_delay <= 0:
+                sys.stdout.write(chunk)
+                sys.stdout.flush()
+                continue
+            
+            # Otherwise pace the chunk word by word, keeping its whitespace
+            for word in re.findall(r'\S+\s*|\s+', chunk):
+                sys.stdout.write(word)
+                sys.stdout.flush()
+                time.sleep(self.typing_delay)  # Adjust typing speed with self.typing_delay
         
-
         print()  # New line at the end
+        return "".join(text)
 
-    def process_user_message(self, user_message: str) -> str:
-
+    def process_user_message_stream(self, user_message: str):
+        """
+        Answer a user message as a stream
+        Yields: text chunks of the AI answer, the full answer is saved to history at the end
+        """
         # it will check that if user message alerady have this messages if it have than it will save it to needs_stock_data 
-        needs_stock_data = any(keyword in user_message.lower() for keyword in [
-            'find', 'show', 'recommend', 'suggest', 'good', 'best', 'stocks', 
-            'companies', 'investment', 'buy', 'portfolio'
-        ])
+        needs_stock_data = NEEDS_DATA_RE.search(user_message.lower()) is not None
         
         stock_data = [] # declaring the stock_data as list 
         if needs_stock_data:
@@ -225,19 +425,21 @@ Be conversational, friendly, and give specific stock recommendations with reason
         
         print("\n AI Assistant: ", end="", flush=True)
         
-        # Get AI response
-        response = self.get_ai_response(prompt) # cakk the response by calling the get_ai_response
-        
-        # this is typing response function effect . 
-        self.simulate_typing(response) 
+        # Pass the AI response through chunk by chunk and keep a copy for memory
+        chunks = []
+        for chunk in self.stream_ai_response(prompt):
+            chunks.append(chunk)
+            yield chunk
         
         # Save conversation to memory saving the conversation for history by calling 
         self.conversation_history.append({
             'user': user_message,
-            'assistant': response
+            'assistant': "".join(chunks)
         })
-        
-        return response
+
+    def process_user_message(self, user_message: str) -> str:
+        # Print the answer as it streams in, stream_typing returns the full response
+        return self.stream_typing(self.process_user_message_stream(user_message))
 
     def show_current_stocks(self):
         """Display stocks currently loaded in memory"""
@@ -253,9 +455,10 @@ Be conversational, friendly, and give specific stock recommendations with reason
             print(f"... and {len(self.current_stocks) - 10} more")
 
     def clear_conversation(self):
-        """Clear conversation history and current stocks"""
-        self.conversation_history = []
+        """Clear conversation history, current stocks and cached search results"""
+        self.conversation_history.clear()
         self.current_stocks = []
+        self._sql_cache.clear()
         print("✅ Conversation cleared")
 
 
@@ -1,19 +1,65 @@
-import requests
+import asyncio
 import sqlite3
 import time
 import pandas as pd
 from bs4 import BeautifulSoup
 from datetime import datetime
 import logging
-import yfinance as yf
+import aiohttp
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Columns written to the stocks table, in INSERT order
+STOCK_COLUMNS = [
+    'symbol', 'name', 'sector', 'industry', 'market_cap', 'pe_ratio', 'pb_ratio',
+    'roe', 'debt_to_equity', 'current_ratio', 'revenue_growth',
+    'net_profit_margin', 'dividend_yield', 'price', 'volume'
+]
+# Yahoo returns these as fractions (0.15), we store them as percentages (15)
+PERCENT_COLUMNS = ['roe', 'revenue_growth', 'net_profit_margin', 'dividend_yield']
+
+# Yahoo Finance JSON endpoints (the same ones yfinance uses under the hood)
+YAHOO_COOKIE_URL = "https://fc.yahoo.com"
+YAHOO_CRUMB_URL = "https://query2.finance.yahoo.com/v1/test/getcrumb"
+YAHOO_QUOTE_URL = "https://query2.finance.yahoo.com/v10/finance/quoteSummary/{symbol}"
+YAHOO_MODULES = "defaultKeyStatistics,financialData,summaryDetail,assetProfile,price"
+YAHOO_HEADERS = {"User-Agent": "Mozilla/5.0"}
+
+class RateLimiter:
+    """Token bucket shared by the scraper tasks to stay under Yahoo's rate limit"""
+    def __init__(self, rate, capacity=None):
+        self.rate = rate  # tokens added per second
+        self.capacity = capacity or rate  # max burst size
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Wait until a request is allowed"""
+        while True:
+            async with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            await asyncio.sleep(wait)
+
+def raw_value(module, key):
+    """Yahoo wraps numbers as {'raw': 0.15, 'fmt': '15%'}, strings come as is"""
+    value = module.get(key)
+    if isinstance(value, dict):
+        return value.get('raw')
+    return value
+
 class StockDataScraper:
-    def __init__(self, db_path="stocks.db"):
+    def __init__(self, db_path="stocks.db", requests_per_second=5):
         self.db_path = db_path
+        self.requests_per_second = requests_per_second
         self.setup_database()
         
     def setup_database(self):
@@ -21,6 +67,9 @@ class StockDataScraper:
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
+        # WAL lets the screener keep reading while the scraper writes, the mode is stored in the file
+        cursor.execute("PRAGMA journal_mode=WAL")
+        
         # Create stocks table with key fundamental metrics
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS stocks (
@@ -43,7 +92,18 @@ class StockDataScraper:
                 last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
-        
+
+        # Indexes for the screener queries - the leading column of each one is
+        # the ORDER BY column, so SQLite can range scan + LIMIT without sorting
+        cursor.executescript('''
+            CREATE INDEX IF NOT EXISTS idx_value ON stocks(pe_ratio, pb_ratio, roe);
+            CREATE INDEX IF NOT EXISTS idx_growth ON stocks(revenue_growth, roe);
+            CREATE INDEX IF NOT EXISTS idx_div ON stocks(dividend_yield);
+            CREATE INDEX IF NOT EXISTS idx_safe ON stocks(debt_to_equity, current_ratio, roe);
+            CREATE INDEX IF NOT EXISTS idx_mcap ON stocks(market_cap);
+            CREATE INDEX IF NOT EXISTS idx_quality ON stocks(roe, pe_ratio, debt_to_equity);
+        ''')
+
         conn.commit()
         conn.close()
         logger.info("Database setup complete")
@@ -89,154 +149,206 @@ class StockDataScraper:
         return nse_stocks[:count]
 
 
-    def fetch_stock_data_yfinance(self, symbol):
-        """Fetch stock data using yfinance"""
+    async def get_crumb(self, session, max_retries=3, delay=2):
+        """
+        Get the cookie + crumb pair Yahoo requires on quoteSummary requests
+        Returns: the crumb, or None if Yahoo didn't hand one out after max_retries attempts
+        """
+        for attempt in range(max_retries):
+            try:
+                # fc.yahoo.com only sets the session cookie, its status code doesn't matter
+                async with session.get(YAHOO_COOKIE_URL):
+                    pass
+                async with session.get(YAHOO_CRUMB_URL) as response:
+                    response.raise_for_status()
+                    crumb = await response.text()
+                if crumb:
+                    return crumb
+                logger.error(f"Attempt {attempt + 1} to get Yahoo crumb returned an empty crumb")
+            
+            except Exception as e:
+                logger.error(f"Attempt {attempt + 1} to get Yahoo crumb failed: {str(e)}")
+            
+            if attempt < max_retries - 1:
+                await asyncio.sleep(delay * 2)  # Longer delay on retry
+        
+        return None
+
+    async def fetch_stock_data(self, session, symbol, crumb, rate_limiter=None):
+        """Fetch stock data from Yahoo's quoteSummary JSON"""
+        # Wait for a token so concurrent requests respect the rate limit
+        if rate_limiter:
+            await rate_limiter.acquire()
+        
         try:
-            stock = yf.Ticker(symbol)
-            info = stock.info
+            params = {"modules": YAHOO_MODULES, "crumb": crumb}
+            async with session.get(YAHOO_QUOTE_URL.format(symbol=symbol), params=params) as response:
+                response.raise_for_status()
+                data = await response.json()
+            
+            result = data['quoteSummary']['result'][0]
+            price = result.get('price', {})
+            summary = result.get('summaryDetail', {})
+            stats = result.get('defaultKeyStatistics', {})
+            financial = result.get('financialData', {})
+            profile = result.get('assetProfile', {})
             
             # Extract key fundamental metrics
             stock_data = {
                 'symbol': symbol,
-                'name': info.get('longName', ''),
-                'sector': info.get('sector', ''),
-                'industry': info.get('industry', ''),
-                'market_cap': info.get('marketCap'),
-                'pe_ratio': info.get('forwardPE') or info.get('trailingPE'),
-                'pb_ratio': info.get('priceToBook'),
-                'roe': info.get('returnOnEquity'),
-                'debt_to_equity': info.get('debtToEquity'),
-                'current_ratio': info.get('currentRatio'),
-                'revenue_growth': info.get('revenueGrowth'),
-                'net_profit_margin': info.get('profitMargins'),
-                'dividend_yield': info.get('dividendYield'),
-                'price': info.get('currentPrice') or info.get('regularMarketPrice'),
-                'volume': info.get('volume')
+                'name': raw_value(price, 'longName') or '',
+                'sector': raw_value(profile, 'sector') or '',
+                'industry': raw_value(profile, 'industry') or '',
+                'market_cap': raw_value(price, 'marketCap') or raw_value(summary, 'marketCap'),
+                'pe_ratio': raw_value(summary, 'forwardPE') or raw_value(stats, 'forwardPE') or raw_value(summary, 'trailingPE'),
+                'pb_ratio': raw_value(stats, 'priceToBook'),
+                'roe': raw_value(financial, 'returnOnEquity'),
+                'debt_to_equity': raw_value(financial, 'debtToEquity'),
+                'current_ratio': raw_value(financial, 'currentRatio'),
+                'revenue_growth': raw_value(financial, 'revenueGrowth'),
+                'net_profit_margin': raw_value(financial, 'profitMargins'),
+                'dividend_yield': raw_value(summary, 'dividendYield'),
+                'price': raw_value(financial, 'currentPrice') or raw_value(price, 'regularMarketPrice'),
+                'volume': raw_value(summary, 'volume')
             }
             
-            # Convert percentages to actual percentages
-            if stock_data['roe']:
-                stock_data['roe'] *= 100
-            if stock_data['revenue_growth']:
-                stock_data['revenue_growth'] *= 100
-            if stock_data['net_profit_margin']:
-                stock_data['net_profit_margin'] *= 100
-            if stock_data['dividend_yield']:
-                stock_data['dividend_yield'] *= 100
-                
+            # Percentages are converted for the whole batch in save_to_database
             return stock_data
             
         except Exception as e:
             logger.error(f"Error fetching data for {symbol}: {str(e)}")
             return None
 
-    def save_to_database(self, stock_data):
-        """Save stock data to SQLite database"""
-        if not stock_data:
-            return False
-            
+    def save_to_database(self, stock_data_list):
+        """Save a batch of stock data to SQLite database in one transaction"""
+        if not stock_data_list:
+            return 0
+        
+        # Column-wise frame so the percentage conversion is one vectorized multiply
+        # (missing values are NaN and stay NaN)
+        df = pd.DataFrame(stock_data_list, columns=STOCK_COLUMNS)
+        df[PERCENT_COLUMNS] = df[PERCENT_COLUMNS].astype(float) * 100
+        
+        # Back to plain Python values for sqlite3, NaN becomes NULL
+        df = df.astype(object).where(df.notna(), None)
+        rows = list(df.itertuples(index=False, name=None))
+        
         conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        # WAL is already set on the file by setup_database, NORMAL sync is safe with it
+        conn.execute("PRAGMA synchronous=NORMAL")
         
         try:
-            cursor.execute('''
-                INSERT OR REPLACE INTO stocks (
-                    symbol, name, sector, industry, market_cap, pe_ratio, pb_ratio,
-                    roe, debt_to_equity, current_ratio, revenue_growth, 
-                    net_profit_margin, dividend_yield, price, volume
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                stock_data['symbol'], stock_data['name'], stock_data['sector'],
-                stock_data['industry'], stock_data['market_cap'], stock_data['pe_ratio'],
-                stock_data['pb_ratio'], stock_data['roe'], stock_data['debt_to_equity'],
-                stock_data['current_ratio'], stock_data['revenue_growth'],
-                stock_data['net_profit_margin'], stock_data['dividend_yield'],
-                stock_data['price'], stock_data['volume']
-            ))
+            # One transaction for the whole batch, so there is a single commit instead of one per stock
+            with conn:
+                conn.executemany('''
+                    INSERT OR REPLACE INTO stocks (
+                        symbol, name, sector, industry, market_cap, pe_ratio, pb_ratio,
+                        roe, debt_to_equity, current_ratio, revenue_growth, 
+                        net_profit_margin, dividend_yield, price, volume
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', rows)
             
-            conn.commit()
-            logger.info(f"Saved data for {stock_data['symbol']}")
-            return True
+            logger.info(f"Saved data for {len(rows)} stocks")
+            return len(rows)
             
         except Exception as e:
-            logger.error(f"Error saving {stock_data['symbol']}: {str(e)}")
-            return False
+            logger.error(f"Error saving batch of {len(rows)} stocks: {str(e)}")
+            return 0
         finally:
             conn.close()
 
-    def scrape_all_stocks(self, batch_size=10, delay=2):
-        """Main function to scrape all stocks with better rate limiting"""
-        stocks = self.get_nse_top_stocks()
-        successful = 0
-        failed = 0
+    async def fetch_with_retry(self, session, symbol, crumb, semaphore, rate_limiter, max_retries=3, delay=2):
+        """Fetch one stock, retrying failed requests"""
+        # The semaphore caps how many requests are in flight at once
+        async with semaphore:
+            for attempt in range(max_retries):
+                stock_data = await self.fetch_stock_data(session, symbol, crumb, rate_limiter)
+                if stock_data:
+                    return stock_data
+                
+                if attempt < max_retries - 1:
+                    logger.warning(f"Attempt {attempt + 1} failed for {symbol}, retrying...")
+                    await asyncio.sleep(delay * 2)  # Longer delay on retry
         
-        logger.info(f"Starting to scrape {len(stocks)} stocks in batches of {batch_size}...")
+        logger.warning(f"Failed to process {symbol} after {max_retries} attempts")
+        return None
+
+    async def gather_all(self, symbols, max_concurrency=16, delay=2):
+        """
+        Fetch all symbols concurrently on one event loop
+        Returns: list of stock data (None for failed symbols), or None if no crumb could be obtained
+        """
+        # Created per run so the limiter and semaphore belong to this event loop
+        rate_limiter = RateLimiter(self.requests_per_second)
+        semaphore = asyncio.Semaphore(max_concurrency)
         
-        # Process in batches to avoid rate limits
-        for batch_start in range(0, len(stocks), batch_size):
-            batch_end = min(batch_start + batch_size, len(stocks))
-            batch = stocks[batch_start:batch_end]
+        async with aiohttp.ClientSession(headers=YAHOO_HEADERS) as session:
+            crumb = await self.get_crumb(session, delay=delay)
+            if crumb is None:
+                return None
             
-            logger.info(f"Processing batch {batch_start//batch_size + 1}: stocks {batch_start+1}-{batch_end}")
-            
-            for i, symbol in enumerate(batch):
-                logger.info(f"Processing {symbol} ({batch_start + i + 1}/{len(stocks)})")
-                
-                # Retry mechanism for failed requests
-                max_retries = 3
-                for attempt in range(max_retries):
-                    try:
-                        stock_data = self.fetch_stock_data_yfinance(symbol)
-                        
-                        if stock_data and self.save_to_database(stock_data):
-                            successful += 1
-                            break
-                        else:
-                            if attempt == max_retries - 1:
-                                failed += 1
-                                logger.warning(f"Failed to process {symbol} after {max_retries} attempts")
-                    
-                    except Exception as e:
-                        logger.error(f"Attempt {attempt + 1} failed for {symbol}: {str(e)}")
-                        if attempt < max_retries - 1:
-                            time.sleep(delay * 2)  # Longer delay on retry
-                        else:
-                            failed += 1
-                
-                # Rate limiting - wait between requests
-                time.sleep(delay)
-            
-            # Longer break between batches
-            if batch_end < len(stocks):
-                logger.info(f"Batch complete. Waiting {delay * 3} seconds before next batch...")
-                time.sleep(delay * 3)
+            return await asyncio.gather(*[
+                self.fetch_with_retry(session, symbol, crumb, semaphore, rate_limiter, delay=delay)
+                for symbol in symbols
+            ])
+
+    def scrape_all_stocks(self, max_concurrency=16, delay=2):
+        """Main function to scrape all stocks concurrently with rate limiting"""
+        stocks = self.get_nse_top_stocks()
+        
+        logger.info(f"Starting to scrape {len(stocks)} stocks with up to {max_concurrency} requests in flight...")
+        
+        # Requests are network bound, so keep many of them in flight on one event loop.
+        # The shared rate limiter paces them instead of fixed sleeps
+        results = asyncio.run(self.gather_all(stocks, max_concurrency=max_concurrency, delay=delay))
+        if results is None:
+            logger.error(f"Could not get a Yahoo crumb, no stocks scraped. Failed: {len(stocks)}")
+            return 0, len(stocks)
+        scraped = [stock_data for stock_data in results if stock_data]
         
+        # Write everything in one go once all fetches are done
+        successful = self.save_to_database(scraped)
+        failed = len(stocks) - successful
+        
+        # Refresh planner statistics so the screener queries use the indexes
+        self.analyze_database()
+
         logger.info(f"Scraping complete! Success: {successful}, Failed: {failed}")
         return successful, failed
 
+    def analyze_database(self):
+        """Run ANALYZE so the query planner has up to date index statistics"""
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("ANALYZE stocks")
+        conn.commit()
+        conn.close()
+
     def get_stock_summary(self):
         """Get summary of scraped data"""
         conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
         
-        # Get basic stats
-        total_stocks = pd.read_sql_query("SELECT COUNT(*) as count FROM stocks", conn)
-        sectors = pd.read_sql_query("SELECT sector, COUNT(*) as count FROM stocks WHERE sector IS NOT NULL GROUP BY sector", conn)
+        # Get basic stats - small results, plain cursor calls are enough
+        (total_stocks,) = cursor.execute("SELECT COUNT(*) FROM stocks").fetchone()
         
         print(f"\n📊 Database Summary:")
-        print(f"Total stocks: {total_stocks.iloc[0]['count']}")
+        print(f"Total stocks: {total_stocks}")
         print(f"\nSector distribution:")
-        print(sectors.to_string(index=False))
+        for sector, count in cursor.execute("SELECT sector, COUNT(*) FROM stocks WHERE sector IS NOT NULL GROUP BY sector"):
+            print(f"{sector:<30} {count}")
         
         # Sample data
-        sample = pd.read_sql_query("""
+        cursor.execute("""
             SELECT symbol, name, sector, pe_ratio, roe, debt_to_equity 
             FROM stocks 
             WHERE pe_ratio IS NOT NULL 
             LIMIT 5
-        """, conn)
+        """)
         
         print(f"\nSample data:")
-        print(sample.to_string(index=False))
+        print(" | ".join(description[0] for description in cursor.description))
+        for row in cursor.fetchall():
+            print(" | ".join(str(value) for value in row))
         
         conn.close()
 
@@ -1,7 +1,6 @@
 import streamlit as st
 import asyncio
 from Nlp_stock import NLPStockScreener  # Your class in a separate file
-import time
 # Config
 API_KEY = "********************************" # <--- paste gemini api key here
 DB_PATH = "*****" # <--- db path here after running the scraper.py
@@ -36,48 +35,22 @@ with st.sidebar:
                 st.write(f"... and {len(screener.current_stocks) - 10} more")
         else:
             st.info("No stocks currently loaded")
-# Display chat history first (in reverse order for most recent at top)
+# Display chat history once, oldest first, so a new exchange streams in below it
 if st.session_state.chat_history:
     st.divider()
-    for user_msg, assistant_msg in reversed(st.session_state.chat_history):
+    for user_msg, assistant_msg in st.session_state.chat_history:
         st.chat_message("user").markdown(user_msg)
         st.chat_message("assistant").markdown(assistant_msg)
 # User input
 user_input = st.chat_input("Type to find Best Indian stocks 🚀")
 if user_input:
-    with st.spinner("Analyzing..."):
-        # Show user message in chat
-        st.chat_message("user").markdown(user_input)
-        
-        # Get assistant response using your existing method
-        response = screener.process_user_message(user_input)
-        
-        # Stream the response word by word
-        assistant_placeholder = st.chat_message("assistant")
-        message_placeholder = assistant_placeholder.empty()
-        
-        # Split response into words and display progressively
-        words = response.split()
-        displayed_text = ""
-        
-        for word in words:
-            displayed_text += word + " "
-            message_placeholder.markdown(displayed_text + "▌")  # Add cursor effect
-            time.sleep(0.02)  # Adjust speed here (0.05 = 50ms between words)
-        
-        # Remove cursor and show final response
-        message_placeholder.markdown(displayed_text)
-        
-        # Save to chat history
-        st.session_state.chat_history.append((user_input, response))
-        
-        # Small delay before rerun
-        time.sleep(0.5)
-        st.rerun()
-# Show previous chat history in expandable format
-if st.session_state.chat_history:
-    st.divider()
-    st.write("📜 Previous Messages:")
-    for user_msg, assistant_msg in st.session_state.chat_history:
-        with st.expander(f"💬 {user_msg}"):
-            st.markdown(assistant_msg)   
+    # Show user message in chat
+    st.chat_message("user").markdown(user_input)
+    
+    # Stream the response as Gemini generates it, write_stream returns the full text
+    with st.chat_message("assistant"):
+        with st.spinner("Analyzing..."):
+            response = st.write_stream(screener.process_user_message_stream(user_input))
+    
+    # Save to chat history, the next interaction's normal rerun renders it with the rest
+    st.session_state.chat_history.append((user_input, response))